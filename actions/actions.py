@@ -27,6 +27,35 @@ except ImportError:
                 "owner_stats": []
             }
 
+# Import the drill-down query engine
+try:
+    from .query_engine import analysis_store
+except ImportError:
+    from query_engine import analysis_store
+
+# Import the precomputed triage lookup
+try:
+    from .triage import risk_level, triage_lookup
+except ImportError:
+    from triage import risk_level, triage_lookup
+
+def load_test_data(file_path):
+    """
+    Reads an uploaded test results file into a DataFrame
+    
+    Args:
+        file_path (str): Path to a tab-separated CSV or an Excel file
+        
+    Returns:
+        pandas.DataFrame: One row per test result
+    """
+    # Determine file type and read accordingly
+    if file_path.endswith('.xlsx') or file_path.endswith('.xls'):
+        return pd.read_excel(file_path)
+    
+    # Assume CSV format
+    return pd.read_csv(file_path, delimiter='\t')
+
 # Import CDCARM URL actions
 try:
     from .cdcarm_actions import (
@@ -239,12 +268,7 @@ class ActionAnalyzeTestFailures(Action):
             return []
         
         try:
-            # Determine file type and read accordingly
-            if file_path.endswith('.xlsx') or file_path.endswith('.xls'):
-                df = pd.read_excel(file_path)
-            else:
-                # Assume CSV format
-                df = pd.read_csv(file_path, delimiter='\t')
+            df = load_test_data(file_path)
             
             # Run analysis
             analysis_results = analyze_failures(df)
@@ -253,8 +277,12 @@ class ActionAnalyzeTestFailures(Action):
             response = self.format_analysis_for_chat(analysis_results)
             dispatcher.utter_message(text=response)
             
+            # Index the results so follow-up questions don't re-scan them
+            analysis_id = analysis_store.save(analysis_results)
+            
             # Store the analysis results for future reference
-            return [SlotSet("analysis_results", analysis_results)]
+            return [SlotSet("analysis_results", analysis_results),
+                    SlotSet("analysis_id", analysis_id)]
             
         except Exception as e:
             dispatcher.utter_message(text=f"Error analyzing the file: {str(e)}")
@@ -384,8 +412,189 @@ Our test failure prediction system works by analyzing patterns in historical tes
 
 The system continually improves as it learns from new test results, making its predictions more accurate over time.
 
+Risk scores are precomputed from the nightly failure history, so you can ask me how risky a test is, like: "How risky is test T-1234?"
+
 Would you like to know more about a specific aspect of the prediction system?
 """
         
         dispatcher.utter_message(text=explanation)
-        return []
\ No newline at end of file
+        return []
+
+def format_test_list(tests, total):
+    """Formats a sample of failing tests, noting how many were left out"""
+    response = ""
+    for i, test in enumerate(tests):
+        response += f"{i+1}. {test['Test']} ({test['Owner']}): {test['Pattern']}\n"
+    
+    if total > len(tests):
+        response += f"... and {total - len(tests)} more\n"
+    
+    return response
+
+def load_stored_analysis(dispatcher, tracker):
+    """Loads the indexed analysis for this conversation, telling the user if there is none"""
+    index = analysis_store.load(tracker.get_slot("analysis_id"))
+    
+    if index is None:
+        dispatcher.utter_message(text="I don't have any analysis data yet. Please upload a test results file first.")
+    
+    return index
+
+class ActionLoadAnalysis(Action):
+    """Action to attach an analysis produced by the streaming upload to the conversation"""
+    
+    def name(self) -> Text:
+        return "action_load_analysis"
+    
+    def run(self, dispatcher: CollectingDispatcher,
+            tracker: Tracker,
+            domain: Dict[Text, Any]) -> List[Dict[Text, Any]]:
+        
+        analysis_id = next(tracker.get_latest_entity_values("analysis_id"), None)
+        index = analysis_store.load(analysis_id)
+        
+        if index is None:
+            dispatcher.utter_message(text="I couldn't find that analysis. Please upload the file again.")
+            return []
+        
+        dispatcher.utter_message(text=f"I've loaded the analysis of {index.size} failing tests. "
+                                      "You can ask me about a specific failure pattern, owner or group of tests.")
+        return [SlotSet("analysis_id", analysis_id)]
+
+class ActionQueryFailures(Action):
+    """Action to filter the stored analysis by owner, pattern or test id and count the results"""
+    
+    def name(self) -> Text:
+        return "action_query_failures"
+    
+    def run(self, dispatcher: CollectingDispatcher,
+            tracker: Tracker,
+            domain: Dict[Text, Any]) -> List[Dict[Text, Any]]:
+        
+        index = load_stored_analysis(dispatcher, tracker)
+        if index is None:
+            return []
+        
+        # Collect the filters from the message
+        filters = {
+            "owner": next(tracker.get_latest_entity_values("failure_owner"), None),
+            "pattern": next(tracker.get_latest_entity_values("failure_pattern"), None),
+            "test_prefix": next(tracker.get_latest_entity_values("test_prefix"), None),
+            "test_contains": next(tracker.get_latest_entity_values("test_substring"), None),
+        }
+        
+        # Only owner and pattern can be grouped on, ignore anything else
+        group_by = next(tracker.get_latest_entity_values("group_by"), None)
+        group_by = group_by.lower().rstrip("s") if group_by else None
+        if group_by not in ("owner", "pattern"):
+            group_by = None
+        
+        result = index.query(group_by=group_by, **filters)
+        
+        descriptions = {
+            "owner": "owned by {}",
+            "pattern": "failing with '{}'",
+            "test_prefix": "starting with '{}'",
+            "test_contains": "containing '{}'",
+        }
+        filter_text = " and ".join(descriptions[key].format(value) for key, value in filters.items() if value)
+        filter_text = f" {filter_text}" if filter_text else ""
+        
+        if result["count"] == 0:
+            dispatcher.utter_message(text=f"I couldn't find any failing tests{filter_text}.")
+            return []
+        
+        response = f"**{result['count']} failing tests{filter_text}**\n\n"
+        
+        if group_by:
+            response += f"**By {group_by}:**\n"
+            for i, (name, count) in enumerate(result["groups"]):
+                response += f"{i+1}. **{name}**: {count} tests\n"
+        else:
+            response += format_test_list(result["tests"], result["count"])
+        
+        dispatcher.utter_message(text=response)
+        return []
+
+class ActionDescribePattern(Action):
+    """Action to drill down into one failure pattern of the stored analysis"""
+    
+    def name(self) -> Text:
+        return "action_describe_pattern"
+    
+    def run(self, dispatcher: CollectingDispatcher,
+            tracker: Tracker,
+            domain: Dict[Text, Any]) -> List[Dict[Text, Any]]:
+        
+        pattern = next(tracker.get_latest_entity_values("failure_pattern"), None)
+        
+        if not pattern:
+            dispatcher.utter_message(text="I couldn't identify which failure pattern you're asking about. Please put it in quotes, like: Tell me more about 'Validation error'.")
+            return []
+        
+        index = load_stored_analysis(dispatcher, tracker)
+        if index is None:
+            return []
+        
+        result = index.query(pattern=pattern, group_by="owner", limit=5)
+        
+        if result["count"] == 0:
+            dispatcher.utter_message(text=f"I couldn't find the pattern '{pattern}' in the analysis results.")
+            return []
+        
+        failure_rate = round(result["count"]/index.size*100)
+        
+        response = f"**Failure Pattern '{pattern}'**\n\n"
+        response += f"Failing Tests: {result['count']} ({failure_rate}% of all failures)\n\n"
+        
+        response += "**Affected Owners:**\n"
+        for i, (owner, count) in enumerate(result["groups"]):
+            response += f"{i+1}. **{owner}**: {count} tests\n"
+        
+        response += "\n**Example tests:**\n"
+        response += format_test_list(result["tests"], result["count"])
+        
+        dispatcher.utter_message(text=response)
+        return []
+
+class ActionGetTestRisk(Action):
+    """Action to report the precomputed failure risk of a test"""
+    
+    def name(self) -> Text:
+        return "action_get_test_risk"
+    
+    def run(self, dispatcher: CollectingDispatcher,
+            tracker: Tracker,
+            domain: Dict[Text, Any]) -> List[Dict[Text, Any]]:
+        
+        # Get the test ID from an entity
+        test_id = next(tracker.get_latest_entity_values("test_id"), None)
+        
+        if not test_id:
+            dispatcher.utter_message(text="I couldn't identify which test you're asking about. Please provide a test ID like T-1234.")
+            return []
+        
+        if not triage_lookup.available():
+            dispatcher.utter_message(text="I don't have any failure history yet. Risk scores are available after the nightly triage run.")
+            return []
+        
+        # Everything was precomputed by the batch run, this is a single indexed read
+        risk = triage_lookup.test_risk(test_id)
+        nights = triage_lookup.meta.get("nights", "0")
+        
+        if not risk:
+            dispatcher.utter_message(text=f"Test {test_id} hasn't failed in the last {nights} nightly runs, so its failure risk is low.")
+            return []
+        
+        response = f"**Failure Risk for Test {test_id}**\n\n"
+        response += f"Risk: **{risk_level(risk['risk'])}** (score {risk['risk']:.2f}, ranked {risk['rank']} of {triage_lookup.meta.get('tests')} failing tests)\n"
+        response += f"Failed in {risk['failures']} of the last {nights} nightly runs, most recently on {risk['last_failed']}\n\n"
+        response += f"Latest failure: {risk['signature']}\n"
+        response += f"Owner: {risk['owner']}\n"
+        
+        if risk["suggested_owner"] and risk["suggested_owner"] != risk["owner"]:
+            share = round(risk["suggested_owner_share"]*100)
+            response += f"Suggested owner: **{risk['suggested_owner']}** (owns {share}% of past failures with this signature)\n"
+        
+        dispatcher.utter_message(text=response)
+        return []
@@ -0,0 +1,413 @@
+# query_engine.py - Drill-down queries over a stored test failure analysis
+#
+# An analysis is flattened into one row per failing test and indexed once,
+# when it is stored. Queries then only touch the precomputed indexes:
+#
+#   - owner and pattern: inverted index from value to the sorted row ids
+#   - test-id prefix:    test ids in sorted order, answered with a binary search
+#   - test-id substring: positional trigram index, a match is a position where
+#                        each of the query's trigrams starts at its offset
+#
+# Filters are combined by intersecting row id arrays and group-by counts are a
+# single bincount over the matching rows, so answers stay in the millisecond
+# range even for analyses with a million rows.
+
+import bisect
+import os
+import pickle
+import re
+import tempfile
+import time
+import uuid
+from collections import OrderedDict
+
+import numpy as np
+
+ANALYSIS_DIR = os.environ.get(
+    "TFIA_ANALYSIS_DIR", os.path.join(tempfile.gettempdir(), "tfia_analyses")
+)
+# Stored analyses past either limit are deleted whenever a new one is saved
+ANALYSIS_KEEP = int(os.environ.get("TFIA_ANALYSIS_KEEP", 20))
+ANALYSIS_MAX_AGE = int(os.environ.get("TFIA_ANALYSIS_MAX_AGE", 7 * 24 * 3600))
+GROUP_BY_FIELDS = ("owner", "pattern")
+
+# Separates test ids while building the trigram index, must not occur in an id
+_ID_SEPARATOR = "\n"
+
+
+def _encode(values):
+    """
+    Dictionary-encodes a column
+
+    Returns:
+        tuple: (list of distinct values, np.ndarray of int32 codes per row)
+    """
+    vocabulary = {}
+    codes = np.fromiter(
+        (vocabulary.setdefault(value, len(vocabulary)) for value in values),
+        dtype=np.int32, count=len(values),
+    )
+    return list(vocabulary), codes
+
+
+def _trigram_keys(text):
+    """
+    Packs every run of three characters into one integer
+
+    Returns:
+        np.ndarray: uint64 key per start position, len(text) - 2 of them
+    """
+    chars = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    if len(chars) < 3:
+        return np.empty(0, dtype=np.uint64)
+    # Code points fit in 21 bits, so three of them fit in one uint64
+    return (chars[:-2] << np.uint64(42)) | (chars[1:-1] << np.uint64(21)) | chars[2:]
+
+
+def _trigram_postings(lowered_ids):
+    """
+    Builds the positional trigram index over the test ids
+
+    Every trigram is indexed with the places it starts at, each packed as
+    (row << shift) | column. The shift leaves room for twice the longest id,
+    so adding an offset within a query to a position never reaches the next
+    row and the row of a match is a single shift away.
+
+    Returns:
+        tuple: (sorted distinct trigram keys, start of each key's positions
+            plus a final end offset, packed positions grouped by key and
+            ascending within each key, shift)
+    """
+    lengths = np.fromiter((len(test_id) for test_id in lowered_ids), dtype=np.int64, count=len(lowered_ids))
+    shift = max(1, int(2 * (lengths.max(initial=0) + 1)).bit_length())
+    position_type = np.int32 if len(lowered_ids) < 2 ** (31 - shift) else np.int64
+
+    # Trailing separators give the last characters of every id a trigram too
+    text = _ID_SEPARATOR.join(lowered_ids) + _ID_SEPARATOR * 2
+    keys = _trigram_keys(text)
+
+    # Row and column of every character, separators belong to the id before them
+    rows = np.repeat(np.arange(len(lowered_ids), dtype=np.int64), lengths + 1)[:len(keys)]
+    id_starts = np.concatenate(([0], np.cumsum(lengths + 1)[:-1])).astype(np.int64)
+    columns = np.arange(len(keys), dtype=np.int64) - id_starts[rows] if len(keys) else rows
+    positions = ((rows << shift) | columns).astype(position_type)
+
+    # Keep only trigrams starting inside an id. Ones running into the separator
+    # serve one and two character queries, longer queries never contain it.
+    separator = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)[:len(keys)] == ord(_ID_SEPARATOR)
+    keys, positions = keys[~separator], positions[~separator]
+
+    # A stable sort keeps the positions of each key ascending
+    order = np.argsort(keys, kind="stable")
+    keys, positions = keys[order], positions[order]
+
+    gram_keys, starts = np.unique(keys, return_index=True)
+    bounds = np.append(starts, len(keys)).astype(np.int64)
+    return gram_keys, bounds, positions, shift
+
+
+def _postings(codes, size):
+    """Builds the inverted index: one sorted array of row ids per code"""
+    order = np.argsort(codes, kind="stable").astype(np.int32)
+    bounds = np.cumsum(np.bincount(codes, minlength=size))[:-1]
+    return np.split(order, bounds)
+
+
+class FailureIndex:
+    """Indexed, read-only view of the failing tests in one analysis"""
+
+    def __init__(self, test_ids, owners, patterns):
+        """
+        Args:
+            test_ids (list): Test id of each failing test
+            owners (list): Owner of each failing test
+            patterns (list): Failure pattern of each failing test
+        """
+        self.test_ids = [str(test_id) for test_id in test_ids]
+        self.size = len(self.test_ids)
+
+        self.owners, self.owner_codes = _encode([str(owner) for owner in owners])
+        self.patterns, self.pattern_codes = _encode([str(pattern) for pattern in patterns])
+        self.owner_rows = _postings(self.owner_codes, len(self.owners))
+        self.pattern_rows = _postings(self.pattern_codes, len(self.patterns))
+
+        # Case-insensitive lookups for values typed in the chat
+        self.owner_lookup = {owner.lower(): code for code, owner in enumerate(self.owners)}
+        self.pattern_lookup = {pattern.lower(): code for code, pattern in enumerate(self.patterns)}
+
+        self.lowered_ids = [test_id.lower() for test_id in self.test_ids]
+        self.id_order = np.array(
+            sorted(range(self.size), key=self.lowered_ids.__getitem__), dtype=np.int32
+        )
+        self.sorted_ids = [self.lowered_ids[row] for row in self.id_order]
+
+        self.gram_keys, self.gram_bounds, self.gram_positions, self.gram_shift = _trigram_postings(self.lowered_ids)
+
+    @classmethod
+    def from_analysis(cls, analysis_results):
+        """
+        Builds an index from the output of analyze_failures
+
+        Args:
+            analysis_results (dict): Analysis with "error_groups", each holding
+                the failing "tests" that share a "pattern"
+
+        Returns:
+            FailureIndex: Index over every test in every error group
+        """
+        test_ids, owners, patterns = [], [], []
+        for group in analysis_results.get("error_groups", []):
+            for test in group.get("tests", []):
+                test_ids.append(test.get("Test", ""))
+                owners.append(test.get("Owner", "Unknown"))
+                patterns.append(group["pattern"])
+        return cls(test_ids, owners, patterns)
+
+    def _match(self, lookup, value):
+        """
+        Resolves a user supplied owner or pattern to codes
+
+        An exact (case-insensitive) match wins, otherwise every value that
+        contains the text matches.
+        """
+        value = value.strip().lower()
+        if value in lookup:
+            return [lookup[value]]
+        return [code for name, code in lookup.items() if value in name]
+
+    def _rows_for(self, postings, codes):
+        """Returns the sorted row ids for a set of codes"""
+        if not codes:
+            return np.empty(0, dtype=np.int32)
+        if len(codes) == 1:
+            return postings[codes[0]]
+        return np.sort(np.concatenate([postings[code] for code in codes]))
+
+    def _rows_with_prefix(self, prefix):
+        prefix = prefix.lower()
+        start = bisect.bisect_left(self.sorted_ids, prefix)
+        end = bisect.bisect_left(self.sorted_ids, prefix + "\U0010ffff", lo=start)
+        return np.sort(self.id_order[start:end])
+
+    def _intersect(self, row_sets):
+        """Intersects sorted row id arrays, starting from the smallest"""
+        row_sets = sorted(row_sets, key=len)
+        rows = row_sets[0]
+        for other in row_sets[1:]:
+            if not len(rows):
+                break
+            keep = np.zeros(self.size, dtype=bool)
+            keep[other] = True
+            rows = rows[keep[rows]]
+        return rows
+
+    def _rows_containing(self, text):
+        text = text.lower()
+        if not text or _ID_SEPARATOR in text:
+            return np.empty(0, dtype=np.int32)
+
+        # Too short for a trigram, take every trigram starting with the text
+        if len(text) < 3:
+            low = _trigram_keys(text + "\x00" * (3 - len(text)))[0]
+            high = _trigram_keys(text + "\U0010ffff" * (3 - len(text)))[0]
+            first = np.searchsorted(self.gram_keys, low, side="left")
+            last = np.searchsorted(self.gram_keys, high, side="right")
+            matched = np.zeros(self.size, dtype=bool)
+            matched[self.gram_positions[self.gram_bounds[first]:self.gram_bounds[last]] >> self.gram_shift] = True
+            return np.flatnonzero(matched).astype(np.int32)
+
+        # Text longer than half the packing room cannot be in any id
+        if len(text) >= 1 << (self.gram_shift - 1):
+            return np.empty(0, dtype=np.int32)
+
+        # Trigrams every three characters, plus the last one, cover the whole text
+        keys = _trigram_keys(text)
+        offsets = list(range(0, len(keys), 3))
+        if offsets[-1] != len(keys) - 1:
+            offsets.append(len(keys) - 1)
+
+        postings = {}
+        for offset in offsets:
+            key = keys[offset]
+            position = np.searchsorted(self.gram_keys, key)
+            if position == len(self.gram_keys) or self.gram_keys[position] != key:
+                return np.empty(0, dtype=np.int32)
+            postings[offset] = self.gram_positions[self.gram_bounds[position]:self.gram_bounds[position + 1]]
+
+        # Start from the rarest trigram and keep the start positions where
+        # every other trigram follows at its offset
+        anchor = min(postings, key=lambda offset: len(postings[offset]))
+        starts = postings[anchor] - anchor
+        for offset, positions in postings.items():
+            if offset == anchor or not len(starts):
+                continue
+            wanted = starts + offset
+            found = np.minimum(np.searchsorted(positions, wanted), len(positions) - 1)
+            starts = starts[positions[found] == wanted]
+
+        # Starts are ascending, so an id matching more than once gives adjacent duplicates
+        rows = (starts >> self.gram_shift).astype(np.int32)
+        if len(rows):
+            rows = rows[np.concatenate(([True], rows[1:] != rows[:-1]))]
+        return rows
+
+    def filter(self, owner=None, pattern=None, test_prefix=None, test_contains=None):
+        """
+        Finds the rows matching every given filter
+
+        Returns:
+            np.ndarray: Sorted row ids, or None when no filter was given
+        """
+        candidates = []
+        if owner:
+            candidates.append(self._rows_for(self.owner_rows, self._match(self.owner_lookup, owner)))
+        if pattern:
+            candidates.append(self._rows_for(self.pattern_rows, self._match(self.pattern_lookup, pattern)))
+        if test_prefix:
+            candidates.append(self._rows_with_prefix(test_prefix))
+        if test_contains:
+            candidates.append(self._rows_containing(test_contains))
+
+        if not candidates:
+            return None
+
+        return self._intersect(candidates)
+
+    def query(self, owner=None, pattern=None, test_prefix=None, test_contains=None,
+              group_by=None, limit=10):
+        """
+        Filters the failing tests and optionally counts them per owner or pattern
+
+        Args:
+            owner (str, optional): Owner name, exact or partial
+            pattern (str, optional): Failure pattern, exact or partial
+            test_prefix (str, optional): Test ids must start with this text
+            test_contains (str, optional): Test ids must contain this text
+            group_by (str, optional): "owner" or "pattern"
+            limit (int, optional): Maximum number of tests and groups returned
+
+        Returns:
+            dict: "count" of matching tests, up to `limit` matching "tests"
+                and, when grouping, the largest "groups" as (name, count)
+        """
+        if group_by is not None and group_by not in GROUP_BY_FIELDS:
+            raise ValueError(f"Cannot group by '{group_by}', expected one of {GROUP_BY_FIELDS}")
+
+        rows = self.filter(owner, pattern, test_prefix, test_contains)
+        count = self.size if rows is None else len(rows)
+        sample = range(min(limit, self.size)) if rows is None else rows[:limit]
+
+        result = {
+            "count": count,
+            "tests": [
+                {
+                    "Test": self.test_ids[row],
+                    "Owner": self.owners[self.owner_codes[row]],
+                    "Pattern": self.patterns[self.pattern_codes[row]],
+                }
+                for row in sample
+            ],
+        }
+
+        if group_by:
+            codes = self.owner_codes if group_by == "owner" else self.pattern_codes
+            names = self.owners if group_by == "owner" else self.patterns
+            counts = np.bincount(codes if rows is None else codes[rows], minlength=len(names))
+            top = np.argsort(-counts, kind="stable")[:limit]
+            result["groups"] = [(names[code], int(counts[code])) for code in top if counts[code]]
+
+        return result
+
+
+class AnalysisStore:
+    """
+    Keeps indexed analyses on disk, with the most recent ones cached in memory
+
+    Only the `keep` most recent analyses younger than `max_age` seconds are
+    kept on disk, older ones are deleted when a new analysis is saved.
+    """
+
+    def __init__(self, directory=ANALYSIS_DIR, cache_size=8, keep=ANALYSIS_KEEP, max_age=ANALYSIS_MAX_AGE):
+        self.directory = directory
+        self.cache_size = cache_size
+        self.keep = keep
+        self.max_age = max_age
+        self._cache = OrderedDict()
+
+    def _path(self, analysis_id):
+        return os.path.join(self.directory, f"{analysis_id}.pkl")
+
+    def _remember(self, analysis_id, index):
+        self._cache[analysis_id] = index
+        self._cache.move_to_end(analysis_id)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def prune(self):
+        """Deletes stored analyses beyond the retention limits"""
+        stored = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith(".pkl"):
+                stored.append((entry.stat().st_mtime, entry.path))
+        stored.sort(reverse=True)
+
+        cutoff = time.time() - self.max_age
+        for i, (mtime, path) in enumerate(stored):
+            if i >= self.keep or mtime < cutoff:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                self._cache.pop(os.path.basename(path)[:-len(".pkl")], None)
+
+    def save(self, analysis_results):
+        """
+        Indexes an analysis and stores it
+
+        Args:
+            analysis_results (dict): Output of analyze_failures
+
+        Returns:
+            str: Id to load the analysis with
+        """
+        index = FailureIndex.from_analysis(analysis_results)
+        analysis_id = uuid.uuid4().hex
+
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self._path(analysis_id), "wb") as f:
+            pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+        self._remember(analysis_id, index)
+        self.prune()
+        return analysis_id
+
+    def load(self, analysis_id):
+        """
+        Loads a stored analysis
+
+        Args:
+            analysis_id (str): Id returned by save
+
+        Returns:
+            FailureIndex: The index, or None if the id is unknown
+        """
+        if analysis_id in self._cache:
+            self._cache.move_to_end(analysis_id)
+            return self._cache[analysis_id]
+
+        # Only accept ids we generated so the id can never escape the directory
+        if not re.fullmatch(r"[0-9a-f]{32}", analysis_id or ""):
+            return None
+
+        path = self._path(analysis_id)
+        if not os.path.exists(path):
+            return None
+
+        with open(path, "rb") as f:
+            index = pickle.load(f)
+
+        self._remember(analysis_id, index)
+        return index
+
+
+analysis_store = AnalysisStore()
@@ -0,0 +1,139 @@
+# test_query_engine.py - Tests for the drill-down query engine
+
+import os
+import time
+
+from actions.query_engine import AnalysisStore, FailureIndex
+
+TESTS = [
+    ("Module1.Wall_Create", "Alice", "Validation error"),
+    ("Module1.Wall_Delete", "Alice", "Timeout"),
+    ("Module1.Door_Create", "Bob", "Validation error"),
+    ("Module2.Wall_Create", "Bob", "Validation error"),
+    ("Module2.Roof_Create", "Carol", "Access violation"),
+    ("module2.wall_move", "Alice", "Validation error"),
+]
+
+
+def build_index(rows=TESTS):
+    return FailureIndex(*zip(*rows)) if rows else FailureIndex([], [], [])
+
+
+def matching_tests(result):
+    return sorted(test["Test"] for test in result["tests"])
+
+
+def test_query_without_filters_returns_everything():
+    result = build_index().query(limit=100)
+    assert result["count"] == len(TESTS)
+    assert len(result["tests"]) == len(TESTS)
+    assert "groups" not in result
+
+
+def test_query_combines_filters():
+    index = build_index()
+
+    result = index.query(owner="alice", pattern="validation")
+    assert result["count"] == 2
+    assert matching_tests(result) == ["Module1.Wall_Create", "module2.wall_move"]
+
+    result = index.query(owner="Bob", test_prefix="module2", test_contains="wall")
+    assert matching_tests(result) == ["Module2.Wall_Create"]
+
+    assert index.query(owner="Carol", pattern="Timeout")["count"] == 0
+
+
+def test_query_partial_owner_and_pattern():
+    index = build_index()
+    assert index.query(owner="ali")["count"] == 3
+    assert index.query(pattern="violation")["count"] == 1
+    assert index.query(owner="nobody")["count"] == 0
+
+
+def test_test_contains_matches_brute_force():
+    index = build_index()
+    for text in ["w", "Wa", "wall_", "_create", "module", "e", "1.D", "missing", "x" * 200]:
+        expected = [test for test, _, _ in TESTS if text.lower() in test.lower()]
+        assert matching_tests(index.query(test_contains=text, limit=100)) == sorted(expected), text
+
+
+def test_query_group_by():
+    index = build_index()
+
+    result = index.query(group_by="owner")
+    assert result["groups"] == [("Alice", 3), ("Bob", 2), ("Carol", 1)]
+
+    result = index.query(test_contains="wall", group_by="pattern")
+    assert result["count"] == 4
+    assert result["groups"] == [("Validation error", 3), ("Timeout", 1)]
+
+    result = index.query(owner="Carol", group_by="owner")
+    assert result["groups"] == [("Carol", 1)]
+
+
+def test_query_limit():
+    result = build_index().query(group_by="owner", limit=1)
+    assert result["count"] == len(TESTS)
+    assert len(result["tests"]) == 1
+    assert result["groups"] == [("Alice", 3)]
+
+
+def test_query_rejects_unknown_group_by():
+    try:
+        build_index().query(group_by="test")
+    except ValueError:
+        return
+    raise AssertionError("query accepted an unknown group_by")
+
+
+def test_empty_index():
+    index = build_index([])
+    assert index.query() == {"count": 0, "tests": []}
+    assert index.query(owner="Alice", test_contains="wall")["count"] == 0
+    assert index.query(test_prefix="Module", group_by="owner")["groups"] == []
+
+
+def test_from_analysis():
+    analysis = {
+        "error_groups": [
+            {"pattern": "Timeout", "tests": [{"Test": "A.one", "Owner": "Alice"}, {"Test": "A.two"}]},
+            {"pattern": "Crash", "tests": [{"Test": "B.one", "Owner": "Bob"}]},
+        ]
+    }
+    result = FailureIndex.from_analysis(analysis).query(group_by="owner")
+    assert result["count"] == 3
+    assert sorted(result["groups"]) == [("Alice", 1), ("Bob", 1), ("Unknown", 1)]
+
+
+def test_store_save_and_load(tmp_path):
+    analysis = {"error_groups": [{"pattern": "Timeout", "tests": [{"Test": "A.one", "Owner": "Alice"}]}]}
+
+    analysis_id = AnalysisStore(str(tmp_path)).save(analysis)
+
+    # A second store, like the one in the other server process, reads it from disk
+    index = AnalysisStore(str(tmp_path)).load(analysis_id)
+    assert index.query()["tests"] == [{"Test": "A.one", "Owner": "Alice", "Pattern": "Timeout"}]
+
+    assert AnalysisStore(str(tmp_path)).load("0" * 32) is None
+    assert AnalysisStore(str(tmp_path)).load("../../etc/passwd") is None
+
+
+def test_store_retention(tmp_path):
+    store = AnalysisStore(str(tmp_path), cache_size=1, keep=2, max_age=3600)
+    ids = []
+    for i in range(4):
+        ids.append(store.save({"error_groups": []}))
+        # Give each file a distinct, increasing modification time
+        stamp = time.time() - 100 + i
+        os.utime(os.path.join(str(tmp_path), f"{ids[-1]}.pkl"), (stamp, stamp))
+    store.prune()
+
+    assert sorted(os.listdir(str(tmp_path))) == sorted(f"{analysis_id}.pkl" for analysis_id in ids[2:])
+    assert store.load(ids[0]) is None
+    assert store.load(ids[3]) is not None
+
+    # Analyses older than max_age are removed even within the count limit
+    old = time.time() - 7200
+    os.utime(os.path.join(str(tmp_path), f"{ids[2]}.pkl"), (old, old))
+    store.prune()
+    assert AnalysisStore(str(tmp_path)).load(ids[2]) is None
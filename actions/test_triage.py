@@ -0,0 +1,189 @@
+# test_triage.py - Tests for the offline failure triage
+
+import os
+import sqlite3
+
+import pandas as pd
+
+from actions.triage import (
+    TriageLookup,
+    acquire_lock,
+    compute_triage,
+    failure_signature,
+    load_history,
+    run_triage,
+    write_lookup,
+)
+
+
+def history_frame(rows):
+    """Builds a load_history style frame from (night, test, owner, message) rows"""
+    return pd.DataFrame(
+        [{"Test": test, "Owner": owner, "ErrorMessage": message, "Status": None, "night": night}
+         for night, test, owner, message in rows]
+    )
+
+
+def write_night(history_dir, name, rows):
+    """Writes one nightly result file from (test, owner, message) rows"""
+    os.makedirs(history_dir, exist_ok=True)
+    pd.DataFrame(rows, columns=["Test", "Owner", "ErrorMessage"]).to_csv(
+        os.path.join(history_dir, f"{name}.csv"), sep="\t", index=False
+    )
+
+
+def test_failure_signature_ignores_numbers_and_paths():
+    assert failure_signature("Timeout after 30 seconds") == failure_signature("Timeout after 45 seconds")
+    assert failure_signature("Crash at 0x00ff12 in C:/builds/1/a.dll") == "Crash at <hex> in <path>"
+    assert failure_signature("First line\nstack trace") == "First line"
+
+
+def test_risk_decays_with_age():
+    nights = 10
+    history = history_frame(
+        [(night, "Always", "Alice", "boom") for night in range(nights)]
+        + [(nights - 1, "Recent", "Alice", "boom"), (0, "Old", "Alice", "boom")]
+    )
+    tests, _ = compute_triage(history, nights, half_life=5)
+
+    assert tests.loc["Always", "risk"] == 1.0
+    assert tests.loc["Recent", "risk"] > tests.loc["Old", "risk"] > 0
+    # A failure half_life runs older counts half as much
+    old = compute_triage(history_frame([(nights - 6, "Old", "Alice", "boom")]), nights, half_life=5)[0]
+    assert abs(old.loc["Old", "risk"] * 2 - tests.loc["Recent", "risk"]) < 1e-3
+    assert list(tests.index[:1]) == ["Always"]
+    assert tests.loc["Always", "rank"] == 1
+
+
+def test_passing_rows_are_ignored():
+    history = history_frame([(0, "A", "Alice", "boom"), (1, "A", "Alice", None), (1, "B", "Bob", "  ")])
+    tests, _ = compute_triage(history, 2)
+    assert list(tests.index) == ["A"]
+    assert tests.loc["A", "failures"] == 1
+
+
+def test_status_column_decides_when_present():
+    history = history_frame([(0, "A", "Alice", "boom"), (0, "B", "Bob", ""), (0, "C", "Carol", "flaky")])
+    history["Status"] = ["Passed", "FAILED", None]
+    tests, _ = compute_triage(history, 1)
+    assert sorted(tests.index) == ["B", "C"]
+
+
+def test_empty_history():
+    tests, signature_owners = compute_triage(load_history([]), 0)
+    assert tests.empty
+    assert signature_owners.empty
+
+
+def test_owner_tie_goes_to_most_recent_failure():
+    history = history_frame([
+        (0, "A", "Zed", "boom"),
+        (3, "B", "Amy", "boom"),
+        (1, "C", "Bob", "boom"),
+    ])
+    _, signature_owners = compute_triage(history, 4)
+    assert signature_owners.loc["boom", "owner"] == "Amy"
+
+    # The same night breaks the tie alphabetically
+    history = history_frame([(2, "A", "Zed", "boom"), (2, "B", "Amy", "boom")])
+    _, signature_owners = compute_triage(history, 3)
+    assert signature_owners.loc["boom", "owner"] == "Amy"
+
+
+def test_most_failures_wins_over_recency():
+    history = history_frame([(0, "A", "Bob", "boom"), (1, "B", "Bob", "boom"), (5, "C", "Amy", "boom")])
+    tests, signature_owners = compute_triage(history, 6)
+    assert signature_owners.loc["boom", "owner"] == "Bob"
+    assert tests.loc["C", "suggested_owner"] == "Bob"
+    assert tests.loc["C", "suggested_owner_share"] == round(2 / 3, 4)
+
+
+def test_write_lookup_and_read_back(tmp_path):
+    history = history_frame([(0, "A", "Alice", "Timeout after 5 s"), (1, "A", "Alice", "Timeout after 9 s")])
+    tests, signature_owners = compute_triage(history, 2)
+    path = str(tmp_path / "triage.sqlite")
+    write_lookup(path, tests, signature_owners, ["2026-10-17", "2026-10-18"], "abc")
+
+    assert os.stat(path).st_mode & 0o777 == 0o644
+    assert [name for name in os.listdir(str(tmp_path))] == ["triage.sqlite"]
+
+    lookup = TriageLookup(path)
+    assert lookup.available()
+    assert lookup.meta["nights"] == "2"
+    assert lookup.meta["history"] == "abc"
+
+    risk = lookup.test_risk("A")
+    assert risk["failures"] == 2
+    assert risk["last_failed"] == "2026-10-18"
+    assert risk["suggested_owner"] == "Alice"
+    assert lookup.test_risk("missing") is None
+
+    assert lookup.suggest_owner("Timeout after 120 s")["owner"] == "Alice"
+    assert lookup.suggest_owner("Something new") is None
+
+
+def test_missing_or_corrupt_lookup_is_unavailable(tmp_path):
+    assert not TriageLookup(str(tmp_path / "missing.sqlite")).available()
+
+    path = tmp_path / "corrupt.sqlite"
+    path.write_bytes(b"not a database" * 100)
+    lookup = TriageLookup(str(path))
+    assert not lookup.available()
+    assert lookup.test_risk("A") is None
+    assert lookup.suggest_owner("boom") is None
+
+    path = tmp_path / "empty_schema.sqlite"
+    sqlite3.connect(str(path)).close()
+    assert not TriageLookup(str(path)).available()
+
+
+def test_run_skips_unchanged_history(tmp_path):
+    history_dir = str(tmp_path / "history")
+    output = str(tmp_path / "triage.sqlite")
+    write_night(history_dir, "2026-10-17", [("A", "Alice", "boom")])
+    write_night(history_dir, "2026-10-18", [("A", "Alice", "boom"), ("B", "Bob", "crash")])
+
+    stats = run_triage(history_dir, output, cron=True)
+    assert stats["nights"] == 2
+    assert stats["tests"] == 2
+    assert stats["failures"] == 3
+    assert run_triage(history_dir, output, cron=True) is None
+    assert run_triage(history_dir, output, cron=True, force=True) is not None
+
+    # A deleted night is noticed even though no file got newer
+    os.remove(os.path.join(history_dir, "2026-10-18.csv"))
+    assert run_triage(history_dir, output, cron=True)["tests"] == 1
+
+    # So is a night copied in with an old modification time
+    write_night(history_dir, "2026-10-16", [("C", "Carol", "boom")])
+    os.utime(os.path.join(history_dir, "2026-10-16.csv"), (0, 0))
+    assert run_triage(history_dir, output, cron=True)["nights"] == 2
+
+    lookup = TriageLookup(output)
+    assert lookup.available()
+    assert lookup.meta["first_night"] == "2026-10-16"
+    assert not os.path.exists(output + ".lock")
+
+
+def test_run_counts_only_failures(tmp_path):
+    history_dir = str(tmp_path / "history")
+    write_night(history_dir, "2026-10-18", [("A", "Alice", ""), ("B", "Bob", "")])
+
+    stats = run_triage(history_dir, str(tmp_path / "triage.sqlite"), cron=True)
+    assert stats["rows"] == 2
+    assert stats["failures"] == 0
+    assert stats["tests"] == 0
+
+
+def test_run_skips_while_locked(tmp_path):
+    history_dir = str(tmp_path / "history")
+    output = str(tmp_path / "triage.sqlite")
+    write_night(history_dir, "2026-10-18", [("A", "Alice", "boom")])
+
+    assert acquire_lock(output + ".lock")
+    assert run_triage(history_dir, output, cron=True) is None
+    assert not os.path.exists(output)
+
+    # A lock left behind by a crashed run expires
+    os.utime(output + ".lock", (0, 0))
+    assert run_triage(history_dir, output, cron=True) is not None
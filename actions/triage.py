@@ -0,0 +1,574 @@
+# triage.py - Offline test failure triage precomputation
+#
+# Reads the stored nightly failure history and precomputes, for every test
+# that failed at least once, a recency-weighted failure risk score and the
+# owner of most past failures with the signature of its latest failure. The
+# results are written to a small SQLite lookup file keyed by test id, so the
+# chat actions answer "how risky is test X?" with a single primary-key read.
+#
+# The history directory holds one tab-separated file per nightly run (the
+# same Test / Owner / ErrorMessage columns as the uploaded files, plus an
+# optional Status column), named so that they sort chronologically, e.g.
+# 2026-10-18.csv. Rows that passed are ignored.
+#
+# Usage:
+#     python -m actions.triage run --history <dir> --output <file>
+#     python -m actions.triage benchmark --days 365
+#
+# Cron-friendly mode only prints errors, exits early when the lookup file was
+# built from the same history files (same names, sizes and modification
+# times, recorded in the file itself) and never runs twice at the same time:
+#     15 6 * * * cd /app && python -m actions.triage run --history <dir> --cron
+
+import argparse
+import hashlib
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+TRIAGE_DB = os.environ.get(
+    "TFIA_TRIAGE_DB", os.path.join(tempfile.gettempdir(), "tfia_triage.sqlite")
+)
+HISTORY_EXTENSIONS = (".csv", ".tsv", ".txt")
+HISTORY_COLUMNS = ("Test", "Owner", "ErrorMessage", "Status")
+
+# Rows with one of these statuses, or with no status and no error message, passed
+PASSING_STATUSES = ("pass", "passed", "ok", "success", "succeeded")
+
+# A failure this many nightly runs ago counts half as much as one last night
+DEFAULT_HALF_LIFE = 30
+
+HIGH_RISK = 0.5
+MEDIUM_RISK = 0.2
+
+# A lock left behind by a run that crashed is ignored after this many seconds
+LOCK_MAX_AGE = 6 * 3600
+
+_SIGNATURE_RULES = [
+    (re.compile(r"0x[0-9a-fA-F]+"), "<hex>"),
+    (re.compile(r"(?:[A-Za-z]:)?(?:[\\/][\w.\-]+){2,}"), "<path>"),
+    (re.compile(r"\d+(?:\.\d+)?"), "<n>"),
+    (re.compile(r"\s+"), " "),
+]
+
+SCHEMA = """
+CREATE TABLE meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+) WITHOUT ROWID;
+
+CREATE TABLE test_risk (
+    test TEXT PRIMARY KEY,
+    risk REAL,
+    rank INTEGER,
+    failures INTEGER,
+    last_failed TEXT,
+    signature TEXT,
+    owner TEXT,
+    suggested_owner TEXT,
+    suggested_owner_share REAL
+) WITHOUT ROWID;
+
+CREATE TABLE signature_owner (
+    signature TEXT PRIMARY KEY,
+    owner TEXT,
+    share REAL,
+    failures INTEGER
+) WITHOUT ROWID;
+"""
+
+
+def failure_signature(message):
+    """
+    Normalizes an error message so failures with the same cause group together
+
+    Numbers, hex values and file paths are replaced by placeholders and only
+    the first line of the message is kept.
+
+    Args:
+        message (str): Raw error message
+
+    Returns:
+        str: Failure signature
+    """
+    signature = str(message).strip().split("\n", 1)[0]
+    for pattern, placeholder in _SIGNATURE_RULES:
+        signature = pattern.sub(placeholder, signature)
+    return signature.strip()[:200]
+
+
+def risk_level(risk):
+    """Maps a risk score to a label for the chat"""
+    if risk >= HIGH_RISK:
+        return "high"
+    if risk >= MEDIUM_RISK:
+        return "medium"
+    return "low"
+
+
+def history_files(history_dir):
+    """Returns the nightly result files in chronological order"""
+    return sorted(
+        os.path.join(history_dir, name)
+        for name in os.listdir(history_dir)
+        if os.path.splitext(name)[1].lower() in HISTORY_EXTENSIONS
+    )
+
+
+def load_history(paths):
+    """
+    Reads the nightly result files into one DataFrame
+
+    Args:
+        paths (list): Nightly result files, oldest first
+
+    Returns:
+        pandas.DataFrame: Test, Owner, ErrorMessage and Status of every row,
+            with the position of its nightly run in "night"
+    """
+    frames = []
+    for night, path in enumerate(paths):
+        df = pd.read_csv(path, delimiter="\t", dtype=str,
+                         usecols=lambda column: column in HISTORY_COLUMNS)
+        for column in HISTORY_COLUMNS:
+            if column not in df:
+                df[column] = None
+        df["night"] = night
+        frames.append(df)
+
+    if not frames:
+        return pd.DataFrame(columns=list(HISTORY_COLUMNS) + ["night"])
+    return pd.concat(frames, ignore_index=True)
+
+
+def failed_rows(history):
+    """
+    Drops the rows of tests that passed
+
+    The Status column decides where it is filled in, otherwise a row with no
+    error message is a pass.
+    """
+    status = history["Status"].fillna("").str.strip().str.lower()
+    message = history["ErrorMessage"].fillna("").str.strip()
+    passed = status.isin(PASSING_STATUSES) | ((status == "") & (message == ""))
+    return history[~passed]
+
+
+def compute_triage(history, night_count, half_life=DEFAULT_HALF_LIFE):
+    """
+    Computes the per-test risk scores and signature owner suggestions
+
+    The risk of a test is the decayed share of nightly runs it failed in, so a
+    test failing every night scores 1.0 and older failures count for less.
+
+    Args:
+        history (pandas.DataFrame): Output of load_history
+        night_count (int): Number of nightly runs in the history
+        half_life (float, optional): Runs after which a failure counts half
+
+    Returns:
+        tuple: (per-test DataFrame, per-signature DataFrame)
+    """
+    history = failed_rows(history).dropna(subset=["Test"]).fillna({"Owner": "Unknown", "ErrorMessage": ""})
+    history = history.drop_duplicates(["Test", "night"], keep="last").reset_index(drop=True)
+
+    # Normalize each distinct message once instead of once per row
+    messages = history["ErrorMessage"].unique()
+    signatures = dict(zip(messages, map(failure_signature, messages)))
+    history["signature"] = history["ErrorMessage"].map(signatures)
+
+    decay = 0.5 ** (1.0 / half_life)
+    history["weight"] = decay ** (night_count - 1 - history["night"])
+    total_weight = (1 - decay ** night_count) / (1 - decay)
+
+    # Signature -> owner of most of its failures. Ties go to the owner who had
+    # it most recently, then alphabetically, so reruns suggest the same owner
+    pairs = history.groupby(["signature", "Owner"]).agg(
+        failures=("night", "size"), last_night=("night", "max")
+    ).reset_index()
+    pairs["share"] = pairs["failures"] / pairs.groupby("signature")["failures"].transform("sum")
+    signature_owners = (
+        pairs.sort_values(["signature", "failures", "last_night", "Owner"],
+                          ascending=[True, False, False, True], kind="mergesort")
+        .drop_duplicates("signature")
+        .drop(columns="last_night")
+        .rename(columns={"Owner": "owner"})
+        .set_index("signature")
+    )
+
+    grouped = history.groupby("Test")
+    tests = pd.DataFrame({
+        "risk": (grouped["weight"].sum() / total_weight).clip(upper=1.0).round(4),
+        "failures": grouped.size(),
+    })
+
+    # Owner and signature of the most recent failure of each test
+    latest = history.loc[grouped["night"].idxmax(), ["Test", "night", "signature", "Owner"]].set_index("Test")
+    tests = tests.join(latest)
+    tests["suggested_owner"] = tests["signature"].map(signature_owners["owner"])
+    tests["suggested_owner_share"] = tests["signature"].map(signature_owners["share"]).round(4)
+
+    tests = tests.sort_values(["risk", "failures"], ascending=False)
+    tests["rank"] = np.arange(1, len(tests) + 1)
+
+    return tests, signature_owners
+
+
+def write_lookup(path, tests, signature_owners, night_names, fingerprint=""):
+    """
+    Writes the precomputed triage to a SQLite lookup file
+
+    The file is built next to the target and moved into place, so the chat
+    actions never read a half-written file. The fingerprint of the history it
+    was built from is kept in the meta table for is_up_to_date.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=directory)
+    os.close(fd)
+
+    try:
+        connection = sqlite3.connect(tmp_path)
+        connection.executescript(SCHEMA)
+
+        last_failed = [night_names[night] for night in tests["night"].tolist()]
+        connection.executemany(
+            "INSERT INTO test_risk VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            zip(tests.index.tolist(), tests["risk"].tolist(), tests["rank"].tolist(),
+                tests["failures"].tolist(), last_failed, tests["signature"].tolist(),
+                tests["Owner"].tolist(), tests["suggested_owner"].tolist(),
+                tests["suggested_owner_share"].tolist()),
+        )
+        connection.executemany(
+            "INSERT INTO signature_owner VALUES (?, ?, ?, ?)",
+            zip(signature_owners.index.tolist(), signature_owners["owner"].tolist(),
+                signature_owners["share"].round(4).tolist(), signature_owners["failures"].tolist()),
+        )
+        connection.executemany("INSERT INTO meta VALUES (?, ?)", [
+            ("nights", str(len(night_names))),
+            ("first_night", night_names[0] if night_names else ""),
+            ("last_night", night_names[-1] if night_names else ""),
+            ("tests", str(len(tests))),
+            ("history", fingerprint),
+            ("generated_at", datetime.now().isoformat(timespec="seconds")),
+        ])
+        connection.commit()
+        connection.close()
+        # mkstemp creates the file readable by its owner only, but the action
+        # server may run as a different user than the batch job
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+
+
+def history_fingerprint(paths, half_life=DEFAULT_HALF_LIFE):
+    """
+    Summarizes the history files and settings a lookup file is built from
+
+    Covers the name, size and modification time of every file, so an added,
+    deleted or replaced nightly file changes the fingerprint even when it was
+    copied with its original timestamp.
+    """
+    digest = hashlib.sha256(f"half_life={half_life}\n".encode())
+    for path in paths:
+        stat = os.stat(path)
+        digest.update(f"{os.path.basename(path)}\t{stat.st_size}\t{stat.st_mtime_ns}\n".encode())
+    return digest.hexdigest()
+
+
+def is_up_to_date(fingerprint, output):
+    """Checks whether the lookup file was built from the history with this fingerprint"""
+    try:
+        connection = sqlite3.connect(f"file:{output}?mode=ro", uri=True)
+        try:
+            row = connection.execute("SELECT value FROM meta WHERE key = 'history'").fetchone()
+        finally:
+            connection.close()
+    except sqlite3.Error:
+        return False
+    return row is not None and row[0] == fingerprint
+
+
+def acquire_lock(path):
+    """
+    Creates a lock file so only one batch run writes the lookup at a time
+
+    Uses an exclusive create rather than flock so it works on every platform.
+    A lock older than LOCK_MAX_AGE is treated as left behind by a crashed run.
+
+    Returns:
+        bool: True if the lock was taken, False if another run holds it
+    """
+    for _ in range(2):
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(path) < LOCK_MAX_AGE:
+                    return False
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            continue
+        with os.fdopen(fd, "w") as f:
+            f.write(str(os.getpid()))
+        return True
+    return False
+
+
+def run_triage(history_dir, output=TRIAGE_DB, half_life=DEFAULT_HALF_LIFE, cron=False, force=False):
+    """
+    Runs the batch pipeline once
+
+    Args:
+        history_dir (str): Directory with one result file per nightly run
+        output (str, optional): Lookup file to write
+        half_life (float, optional): Runs after which a failure counts half
+        cron (bool, optional): Print nothing but errors and skip the run when
+            another one holds the lock or the output is already up to date
+        force (bool, optional): Rebuild even if the output is up to date
+
+    Returns:
+        dict: Timings and sizes of the run, or None if it was skipped
+    """
+    log = (lambda *args: None) if cron else print
+
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    lock_path = output + ".lock"
+    if not acquire_lock(lock_path):
+        log("Another triage run is in progress, skipping")
+        return None
+
+    try:
+        paths = history_files(history_dir)
+        if not paths:
+            raise ValueError(f"No nightly result files found in {history_dir}")
+
+        fingerprint = history_fingerprint(paths, half_life)
+        if not force and is_up_to_date(fingerprint, output):
+            log(f"{output} is up to date, skipping")
+            return None
+
+        started = time.perf_counter()
+        history = load_history(paths)
+        loaded = time.perf_counter()
+
+        tests, signature_owners = compute_triage(history, len(paths), half_life)
+        computed = time.perf_counter()
+
+        night_names = [os.path.splitext(os.path.basename(path))[0] for path in paths]
+        write_lookup(output, tests, signature_owners, night_names, fingerprint)
+        written = time.perf_counter()
+    finally:
+        os.remove(lock_path)
+
+    stats = {
+        "nights": len(paths),
+        "rows": len(history),
+        "failures": int(tests["failures"].sum()),
+        "tests": len(tests),
+        "signatures": len(signature_owners),
+        "load_seconds": round(loaded - started, 3),
+        "compute_seconds": round(computed - loaded, 3),
+        "write_seconds": round(written - computed, 3),
+        "output_bytes": os.path.getsize(output),
+    }
+    log(f"Triage of {stats['failures']} failures in {stats['rows']} result rows over {stats['nights']} nightly runs "
+        f"written to {output}")
+    log(f"{stats['tests']} tests, {stats['signatures']} signatures, "
+        f"load {stats['load_seconds']}s, compute {stats['compute_seconds']}s, write {stats['write_seconds']}s")
+    return stats
+
+
+class TriageLookup:
+    """Read-only access to the lookup file written by run_triage"""
+
+    def __init__(self, path=TRIAGE_DB):
+        self.path = path
+        self._connection = None
+        self._mtime = None
+        self.meta = {}
+
+    def _connect(self):
+        """
+        Returns an open connection, reopening it after a batch run replaced the file
+
+        A missing, unreadable or corrupt file is treated as not produced yet.
+        """
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+            if self._connection is None or mtime != self._mtime:
+                self._close()
+                self._connection = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True,
+                                                   check_same_thread=False)
+                self._connection.row_factory = sqlite3.Row
+                self._mtime = mtime
+                self.meta = dict(self._connection.execute("SELECT key, value FROM meta"))
+        except (OSError, sqlite3.Error):
+            self._close()
+            return None
+        return self._connection
+
+    def _close(self):
+        """Closes the current connection, if any"""
+        if self._connection is not None:
+            self._connection.close()
+        self._connection = None
+        self._mtime = None
+        self.meta = {}
+
+    def _fetch_one(self, query, params):
+        """Runs a single-row query, returning None if the file is missing or unreadable"""
+        connection = self._connect()
+        if connection is None:
+            return None
+        try:
+            row = connection.execute(query, params).fetchone()
+        except sqlite3.Error:
+            self._close()
+            return None
+        return dict(row) if row else None
+
+    def available(self):
+        """Checks whether a batch run has produced a readable lookup file yet"""
+        return self._connect() is not None
+
+    def test_risk(self, test_id):
+        """
+        Looks up the precomputed risk of a test
+
+        Returns:
+            dict: Risk, rank, failure count, last failure and suggested owner,
+                or None if the test has no recorded failures
+        """
+        return self._fetch_one("SELECT * FROM test_risk WHERE test = ?", (test_id,))
+
+    def suggest_owner(self, error_message):
+        """
+        Suggests an owner for an error message from the failure history
+
+        Returns:
+            dict: Owner, share of past failures they owned and failure count,
+                or None if the signature has not been seen before
+        """
+        return self._fetch_one("SELECT owner, share, failures FROM signature_owner WHERE signature = ?",
+                               (failure_signature(error_message),))
+
+
+triage_lookup = TriageLookup()
+
+
+def generate_synthetic_history(history_dir, days=365, tests=50000, owners=200, seed=0):
+    """
+    Writes a synthetic nightly failure history for benchmarking
+
+    Most tests are stable, a few are flaky and a few break for a stretch of
+    nights, and error messages carry varying numbers and paths.
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(history_dir, exist_ok=True)
+
+    test_ids = np.array([f"Module{i % 97}.Test_{i:06d}" for i in range(tests)])
+    test_owners = np.array([f"Owner{i}" for i in range(owners)])[rng.integers(0, owners, tests)]
+    failure_rate = rng.choice([0.001, 0.02, 0.3], size=tests, p=[0.9, 0.08, 0.02])
+    test_messages = rng.integers(0, 500, tests)
+    # Letter tags survive signature normalization, giving 500 distinct signatures
+    tags = ["".join(chr(ord("A") + m // 26 ** k % 26) for k in range(2)) for m in range(500)]
+
+    templates = [
+        "Validation error in step {n}: expected {a} but got {b}",
+        "Wall label mismatch at C:/builds/nightly/{n}/model.scdoc",
+        "Expected/Actual mismatch: value {a} differs from {b}",
+        "Timeout after {n} seconds waiting for solver",
+        "Access violation at address 0x{n:08x}",
+    ]
+
+    start = date.today() - timedelta(days=days)
+    for day in range(days):
+        failing = rng.random(tests) < failure_rate
+        # Roughly one test in a thousand breaks outright for a week
+        failing |= (np.arange(tests) % 1000) == ((day // 7) % 1000)
+        rows = np.flatnonzero(failing)
+        numbers = rng.integers(0, 10000, (len(rows), 3))
+        messages = [
+            f"[{tags[test_messages[row]]}] " + templates[test_messages[row] % len(templates)].format(n=n, a=a, b=b)
+            for row, (n, a, b) in zip(rows, numbers)
+        ]
+        pd.DataFrame({
+            "Test": test_ids[rows],
+            "Owner": test_owners[rows],
+            "ErrorMessage": messages,
+        }).to_csv(os.path.join(history_dir, f"{start + timedelta(days=day)}.csv"), sep="\t", index=False)
+
+
+def benchmark(days=365, tests=50000, lookups=10000):
+    """Times the batch pipeline and the chat lookups on synthetic nightly data"""
+    workdir = tempfile.mkdtemp(prefix="tfia_triage_bench_")
+    try:
+        history_dir = os.path.join(workdir, "history")
+        output = os.path.join(workdir, "triage.sqlite")
+
+        started = time.perf_counter()
+        generate_synthetic_history(history_dir, days=days, tests=tests)
+        print(f"Generated {days} nightly runs for {tests} tests in {time.perf_counter() - started:.1f}s")
+
+        started = time.perf_counter()
+        stats = run_triage(history_dir, output)
+        print(f"Batch run took {time.perf_counter() - started:.2f}s, lookup file is {stats['output_bytes'] / 1024:.0f} KiB")
+
+        lookup = TriageLookup(output)
+        sample = [f"Module{i % 97}.Test_{i:06d}" for i in np.random.default_rng(1).integers(0, tests, lookups)]
+        lookup.test_risk(sample[0])
+
+        started = time.perf_counter()
+        for test_id in sample:
+            lookup.test_risk(test_id)
+        elapsed = time.perf_counter() - started
+        print(f"{lookups} risk lookups took {elapsed:.3f}s ({elapsed / lookups * 1e6:.0f}us each)")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m actions.triage", description="Offline test failure triage precomputation")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Precompute the triage lookup file from the failure history")
+    run_parser.add_argument("--history", required=True, help="Directory with one result file per nightly run")
+    run_parser.add_argument("--output", default=TRIAGE_DB, help=f"Lookup file to write (default: {TRIAGE_DB})")
+    run_parser.add_argument("--half-life", type=float, default=DEFAULT_HALF_LIFE,
+                            help="Nightly runs after which a failure counts half")
+    run_parser.add_argument("--cron", action="store_true",
+                            help="Only print errors and skip the run if it is locked or up to date")
+    run_parser.add_argument("--force", action="store_true", help="Rebuild even if the output is up to date")
+
+    bench_parser = commands.add_parser("benchmark", help="Time the pipeline on synthetic nightly data")
+    bench_parser.add_argument("--days", type=int, default=365)
+    bench_parser.add_argument("--tests", type=int, default=50000)
+
+    args = parser.parse_args(argv)
+
+    if args.command == "benchmark":
+        benchmark(days=args.days, tests=args.tests)
+        return 0
+
+    try:
+        run_triage(args.history, args.output, args.half_life, cron=args.cron, force=args.force)
+    except Exception as e:
+        print(f"Triage run failed: {str(e)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
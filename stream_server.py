@@ -0,0 +1,178 @@
+# stream_server.py - Streaming upload and analysis endpoints for the web client
+#
+# Run next to the action server with:
+#     python stream_server.py
+#
+# This lives outside the actions package because the action server imports
+# every module in that package, and would create this Sanic app as well.
+#
+# The web client uploads the raw test results file to /upload and then reads
+# the analysis from /analyze/<upload_id> as Server-Sent Events, so progress,
+# the top failure patterns and the most affected owners are rendered as soon
+# as each one is available instead of after one blocking request.
+
+import asyncio
+import json
+import os
+import re
+import tempfile
+import time
+import uuid
+
+from sanic import Sanic
+from sanic.response import json as json_response
+from sanic_cors import CORS
+
+from actions.actions import analyze_failures, load_test_data
+from actions.query_engine import analysis_store
+
+UPLOAD_DIR = os.environ.get(
+    "TFIA_UPLOAD_DIR", os.path.join(tempfile.gettempdir(), "tfia_uploads")
+)
+ALLOWED_EXTENSIONS = (".csv", ".xlsx", ".xls")
+TOP_N = 3
+
+# Uploads are deleted once analyzed, this only catches ones never analyzed
+UPLOAD_MAX_AGE = int(os.environ.get("TFIA_UPLOAD_MAX_AGE", 3600))
+
+app = Sanic("tfia_stream_server")
+app.config.REQUEST_MAX_SIZE = int(os.environ.get("TFIA_MAX_UPLOAD_BYTES", 200 * 1024 * 1024))
+CORS(app)
+
+
+def upload_path(upload_id, extension):
+    """Returns the on-disk location of an uploaded file"""
+    return os.path.join(UPLOAD_DIR, f"{upload_id}{extension}")
+
+
+def find_upload(upload_id):
+    """
+    Finds a previously uploaded file by its id
+
+    Args:
+        upload_id (str): Id returned by the upload endpoint
+
+    Returns:
+        str: Path of the uploaded file, or None if it does not exist
+    """
+    # Only accept ids we generated so the id can never escape UPLOAD_DIR
+    if not re.fullmatch(r"[0-9a-f]{32}", upload_id or ""):
+        return None
+
+    for extension in ALLOWED_EXTENSIONS:
+        path = upload_path(upload_id, extension)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def remove_file(path):
+    """Deletes a file, ignoring it if it is already gone"""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def remove_stale_uploads():
+    """Deletes uploads older than UPLOAD_MAX_AGE that were never analyzed"""
+    cutoff = time.time() - UPLOAD_MAX_AGE
+    for entry in os.scandir(UPLOAD_DIR):
+        if entry.is_file() and entry.stat().st_mtime < cutoff:
+            remove_file(entry.path)
+
+
+def to_json(value):
+    """Serializes analysis output, converting numpy scalars to plain numbers"""
+    return json.dumps(value, default=lambda v: v.item() if hasattr(v, "item") else str(v))
+
+
+async def send_event(response, event, data):
+    """Writes a single Server-Sent Event to an open streaming response"""
+    await response.send(f"event: {event}\ndata: {to_json(data)}\n\n")
+
+
+@app.post("/upload", stream=True)
+async def upload(request):
+    """Receives a test results file, writing each chunk to disk as it arrives"""
+    filename = request.headers.get("x-file-name", "")
+    extension = os.path.splitext(filename)[1].lower()
+
+    if extension not in ALLOWED_EXTENSIONS:
+        return json_response({"error": "Unsupported file format. Please upload a CSV or Excel file."}, status=400)
+
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    remove_stale_uploads()
+    upload_id = uuid.uuid4().hex
+    file_path = upload_path(upload_id, extension)
+    size = 0
+
+    try:
+        with open(file_path, "wb") as f:
+            while True:
+                chunk = await request.stream.read()
+                if chunk is None:
+                    break
+                f.write(chunk)
+                size += len(chunk)
+    except BaseException:
+        # Aborted or failed uploads (including cancellation) must not leave partial files behind
+        remove_file(file_path)
+        raise
+
+    return json_response({"upload_id": upload_id, "filename": filename, "bytes": size})
+
+
+@app.get("/analyze/<upload_id>")
+async def analyze(request, upload_id):
+    """Streams the analysis of an uploaded file as Server-Sent Events"""
+    file_path = find_upload(upload_id)
+
+    if not file_path:
+        return json_response({"error": "I couldn't find the uploaded file. Please upload it again."}, status=404)
+
+    response = await request.respond(
+        content_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+    loop = asyncio.get_running_loop()
+
+    try:
+        await send_event(response, "progress", {"stage": "reading", "message": "Reading file..."})
+        df = await loop.run_in_executor(None, load_test_data, file_path)
+
+        # The row count is known before the analysis runs, so send it straight away
+        await send_event(response, "progress", {
+            "stage": "analyzing",
+            "message": f"Loaded {len(df)} rows, grouping failures...",
+            "rows": len(df),
+        })
+        analysis_results = await loop.run_in_executor(None, analyze_failures, df)
+
+        await send_event(response, "summary", {
+            "total_tests": analysis_results["total_tests"],
+            "failure_count": analysis_results["failure_count"],
+        })
+        await send_event(response, "patterns", [
+            {key: group[key] for key in ("pattern", "count", "percentage")}
+            for group in analysis_results["error_groups"][:TOP_N]
+        ])
+        await send_event(response, "owners", [
+            {key: owner[key] for key in ("owner", "count", "percentage")}
+            for owner in analysis_results["owner_stats"][:TOP_N]
+        ])
+
+        # Index the results so the chat can answer drill-down questions about them
+        analysis_id = await loop.run_in_executor(None, analysis_store.save, analysis_results)
+        await send_event(response, "done", {"analysis_id": analysis_id})
+    except Exception as e:
+        await send_event(response, "failed", {"message": f"Error analyzing the file: {str(e)}"})
+    finally:
+        # The analysis is stored by now, so the raw upload is no longer needed
+        remove_file(file_path)
+
+    await response.eof()
+
+
+if __name__ == "__main__":
+    app.run(host="0.0.0.0", port=int(os.environ.get("TFIA_STREAM_PORT", 5056)))